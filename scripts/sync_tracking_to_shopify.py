@@ -71,6 +71,15 @@ def sync_once(client: ShopifyClient, limit: int, notify_customer: bool) -> int:
         print("Ingen usynkede tracking-jobber.")
         return 0
 
+    # Hent fulfillments for hele runden i ett GraphQL-kall; faller tilbake til REST per ordre.
+    prefetched: Dict[int, List[Dict[str, Any]]] = {}
+    order_ids = [oid for oid in (_extract_order_id(job) for job in jobs) if oid]
+    if order_ids:
+        try:
+            prefetched = client.list_fulfillments_bulk(order_ids)
+        except Exception as exc:
+            print(f"Bulk-oppslag av fulfillments feilet, bruker REST per ordre: {exc}")
+
     synced_count = 0
     for job in jobs:
         job_id = int(job["id"])
@@ -86,8 +95,10 @@ def sync_once(client: ShopifyClient, limit: int, notify_customer: bool) -> int:
             continue
 
         try:
-            data = client.list_fulfillments(order_id)
-            fulfillments = data.get("fulfillments") or []
+            if order_id in prefetched:
+                fulfillments = prefetched[order_id]
+            else:
+                fulfillments = client.list_fulfillments(order_id).get("fulfillments") or []
             if not fulfillments:
                 db.mark_tracking_sync_error(
                     job_id,
@@ -1,24 +1,55 @@
 # src/packchicken/bring_client.py
 from __future__ import annotations
 import os
-import json
 import logging
 from typing import Any, Dict, List, Optional
 import requests
 from requests import Response
-from pathlib import Path
-from dotenv import load_dotenv  # pip install python-dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from packchicken.utils import fastjson
+from packchicken.utils.env import load_env_files
 
 # last secrets.env hvis den finnes
-for candidate in (".env", "secrets.env"):
-    p = Path(candidate)
-    if p.exists():
-        load_dotenv(p)
-        break
+load_env_files((".env", "secrets.env"), first_only=True)
 
 
 DEFAULT_TIMEOUT = (10, 30)  # (connect, read) seconds
 
+
+class BookingRetry(Retry):
+    """
+    Som Retry, men prøver også POST på nytt ved 429: da har Bring avvist kallet
+    før bookingen ble utført, så et nytt forsøk kan ikke gi dobbel booking.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if status_code == 429 and method.upper() == "POST":
+            return bool(self.total)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def make_session() -> requests.Session:
+    """
+    Session med keep-alive-pool mot Bring. Tilkoblingsfeil prøves på nytt for alle
+    metoder; 5xx kun for GET, siden en booking-POST ikke er idempotent (Bring har
+    ingen Idempotency-Key). 429 prøves på nytt for alle metoder og respekterer Retry-After.
+    """
+    retry = BookingRetry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+
 class BringError(RuntimeError):
     def __init__(self, message: str, response: Optional[Response] = None):
         super().__init__(message)
@@ -69,12 +100,19 @@ class BringClient:
         # Booking endpoint er likt for test/prod; 'testIndicator' i payload styrer modusen.
         self.endpoint = "https://api.bring.com/booking/api/booking"
 
-        self.session = session or requests.Session()
+        self.session = session or make_session()
+        self._headers_cache: Optional[Dict[str, str]] = None
         self.log = logging.getLogger(__name__)
 
     # --- Headers & request helper -------------------------------------------------
 
     def _headers(self) -> Dict[str, str]:
+        # Bygges én gang per klient og deles mellom kallene (booking og etikettnedlasting); må ikke muteres.
+        if self._headers_cache is None:
+            self._headers_cache = self._build_headers()
+        return self._headers_cache
+
+    def _build_headers(self) -> Dict[str, str]:
         # Historisk har Bring brukt X-MyBring-API-* headere.
         # Accept og Content-Type må være JSON.
         headers = {
@@ -89,10 +127,10 @@ class BringClient:
         return headers
 
     def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        body = json.dumps(payload, ensure_ascii=False)
+        body = fastjson.dumps_bytes(payload)
         resp = self.session.post(
             self.endpoint,
-            data=body.encode("utf-8"),
+            data=body,
             headers=self._headers(),
             timeout=DEFAULT_TIMEOUT,
         )
@@ -106,12 +144,34 @@ class BringClient:
             raise BringError(f"Bring booking feilet: HTTP {resp.status_code}", resp)
 
         try:
-            return resp.json()
+            return fastjson.loads(resp.content)
         except Exception as e:
             raise BringError(f"Ugyldig JSON-respons fra Bring: {e}", resp)
 
     # --- Public API ---------------------------------------------------------------
 
+    @staticmethod
+    def normalize_package(
+        p: Dict[str, Any],
+        idx: int = 1,
+        package_correlation_prefix: str = "PACKAGE",
+        goods_description: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Én pakke på Bring-formatet (dimensjoner/vekt og valgfri beskrivelse)."""
+        dims = p["dimensions"]
+        return {
+            "containerId": p.get("containerId"),
+            "correlationId": p.get("correlationId") or f"{package_correlation_prefix}-{idx}",
+            "dimensions": {
+                "heightInCm": dims["heightInCm"],
+                "lengthInCm": dims["lengthInCm"],
+                "widthInCm": dims["widthInCm"],
+            },
+            "goodsDescription": p.get("goodsDescription") or goods_description or "Goods",
+            "packageType": p.get("packageType"),
+            "weightInKg": p["weightInKg"],
+        }
+
     def build_booking_payload(
         self,
         *,
@@ -134,21 +194,10 @@ class BringClient:
         """
 
         # Sett sammen pakker med dimensjoner/vekt og valgfri beskrivelse
-        normalized_packages: List[Dict[str, Any]] = []
-        for idx, p in enumerate(packages, start=1):
-            pkg = {
-                "containerId": p.get("containerId"),
-                "correlationId": p.get("correlationId") or f"{package_correlation_prefix}-{idx}",
-                "dimensions": {
-                    "heightInCm": p["dimensions"]["heightInCm"],
-                    "lengthInCm": p["dimensions"]["lengthInCm"],
-                    "widthInCm": p["dimensions"]["widthInCm"],
-                },
-                "goodsDescription": p.get("goodsDescription") or goods_description or "Goods",
-                "packageType": p.get("packageType"),
-                "weightInKg": p["weightInKg"],
-            }
-            normalized_packages.append(pkg)
+        normalized_packages = [
+            self.normalize_package(p, idx, package_correlation_prefix, goods_description)
+            for idx, p in enumerate(packages, start=1)
+        ]
 
         payload: Dict[str, Any] = {
             "consignments": [
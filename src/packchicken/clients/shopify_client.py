@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import os
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 import requests
 
@@ -13,6 +13,29 @@ log = get_logger("packchicken.shopify")
 DEFAULT_TIMEOUT = 20  # seconds
 MAX_RETRIES = 5
 BACKOFF_BASE = 0.6  # exponential backoff base seconds
+# Shopify rejects single queries above 1000 cost points; keep a safety margin.
+GRAPHQL_COST_BUDGET = 900
+FULFILLMENTS_FIRST = 10
+TRACKING_INFO_FIRST = 1
+# Estimated cost per order in nodes(ids:): the order plus each fulfillment and its trackingInfo objects.
+FULFILLMENTS_QUERY_COST_PER_ORDER = 1 + FULFILLMENTS_FIRST * (1 + TRACKING_INFO_FIRST)
+GRAPHQL_NODES_LIMIT = max(1, (GRAPHQL_COST_BUDGET - 1) // FULFILLMENTS_QUERY_COST_PER_ORDER)
+
+FULFILLMENTS_BY_ORDERS_QUERY = f"""
+query FulfillmentsByOrders($ids: [ID!]!) {{
+  nodes(ids: $ids) {{
+    ... on Order {{
+      legacyResourceId
+      fulfillments(first: {FULFILLMENTS_FIRST}) {{
+        legacyResourceId
+        status
+        createdAt
+        trackingInfo(first: {TRACKING_INFO_FIRST}) {{ number url }}
+      }}
+    }}
+  }}
+}}
+"""
 
 
 class ShopifyClient:
@@ -211,6 +234,44 @@ class ShopifyClient:
         """
         return self._request("GET", f"/orders/{order_id}/fulfillments.json")
 
+    def list_fulfillments_bulk(self, order_ids: Iterable[int | str]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Fetch fulfillments for many orders with one GraphQL query per GRAPHQL_NODES_LIMIT orders
+        (sized from the estimated query cost),
+        instead of one REST call per order. Results are shaped like the REST
+        `fulfillments` list (id, status, created_at, tracking_*), keyed by order id.
+        Orders Shopify does not return, or whose fulfillment list may be truncated,
+        are left out of the result.
+        """
+        ids = list(dict.fromkeys(int(oid) for oid in order_ids))
+        result: Dict[int, List[Dict[str, Any]]] = {}
+        for start in range(0, len(ids), GRAPHQL_NODES_LIMIT):
+            chunk = ids[start:start + GRAPHQL_NODES_LIMIT]
+            data = self.graphql_query(
+                FULFILLMENTS_BY_ORDERS_QUERY,
+                {"ids": [f"gid://shopify/Order/{oid}" for oid in chunk]},
+            )
+            for node in (data.get("data") or {}).get("nodes") or []:
+                if not node or not node.get("legacyResourceId"):
+                    continue
+                if len(node.get("fulfillments") or []) >= FULFILLMENTS_FIRST:
+                    # Possibly truncated; leave it out so the caller falls back to REST for this order.
+                    continue
+                fulfillments = []
+                for f in node.get("fulfillments") or []:
+                    tracking = f.get("trackingInfo") or []
+                    numbers = [t["number"] for t in tracking if t.get("number")]
+                    fulfillments.append({
+                        "id": int(f["legacyResourceId"]),
+                        "status": str(f.get("status") or "").lower(),
+                        "created_at": f.get("createdAt"),
+                        "tracking_number": numbers[0] if numbers else None,
+                        "tracking_numbers": numbers,
+                        "tracking_url": next((t["url"] for t in tracking if t.get("url")), None),
+                    })
+                result[int(node["legacyResourceId"])] = fulfillments
+        return result
+
     def update_fulfillment_tracking(
         self,
         fulfillment_id: int | str,
@@ -1,17 +1,19 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import hashlib
 import hmac
 import os
 import sqlite3
 import subprocess
 import sys
+import tempfile
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict
 
-from dotenv import load_dotenv
-from flask import Flask, jsonify, render_template_string, request, send_from_directory
+from flask import Flask, Response, jsonify, render_template_string, request, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 
 CURRENT_FILE = Path(__file__).resolve()
@@ -20,15 +22,14 @@ SRC_DIR = REPO_ROOT / "src"
 if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
-from packchicken.utils import db
+from packchicken.utils import db, fastjson
+from packchicken.utils.env import load_env_files
 from packchicken.utils.orders_csv import enqueue_orders_from_csv
 from packchicken.workers.job_worker import process_all_pending_jobs
 
 # Paths and env
-for candidate in (REPO_ROOT / ".env", REPO_ROOT / "secrets.env"):
-    if candidate.exists():
-        # Ikke overstyr eksplisitt satte miljøvariabler (f.eks. fra shell)
-        load_dotenv(candidate, override=False)
+# Ikke overstyr eksplisitt satte miljøvariabler (f.eks. fra shell)
+load_env_files((REPO_ROOT / ".env", REPO_ROOT / "secrets.env"))
 
 ORDERS_DIR = Path(os.getenv("ORDERS_DIR", REPO_ROOT / "ORDERS")).resolve()
 LABEL_DIR = Path(os.getenv("LABEL_DIR", REPO_ROOT / "LABELS")).resolve()
@@ -36,7 +37,23 @@ ORDERS_DIR.mkdir(parents=True, exist_ok=True)
 LABEL_DIR.mkdir(parents=True, exist_ok=True)
 db.init_db()
 
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Serialiserer API-svar med orjson (C-utvidelse) i stedet for stdlib json.
+    /api/jobs polles kontinuerlig, så dette sparer CPU per forespørsel.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return fastjson.dumps(obj, default=self.default)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return fastjson.loads(s)
+
+
 app = Flask(__name__)
+if fastjson.HAVE_ORJSON:
+    app.json = ORJSONProvider(app)
 
 # -------- Auth (optional) --------
 AUTH_TOKEN = os.getenv("PACKCHICKEN_GUI_TOKEN") or os.getenv("PACKCHICKEN_AUTH_TOKEN")
@@ -44,6 +61,9 @@ AUTH_USER = os.getenv("PACKCHICKEN_GUI_USER") or os.getenv("PACKCHICKEN_AUTH_USE
 AUTH_PASS = os.getenv("PACKCHICKEN_GUI_PASSWORD") or os.getenv("PACKCHICKEN_AUTH_PASSWORD")
 AUTH_ENABLED = bool(AUTH_TOKEN or (AUTH_USER and AUTH_PASS))
 LOG_FILE_PATH = Path(os.getenv("LOG_FILE", REPO_ROOT / "logs/packchicken.log")).resolve()
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Hvor ofte /events sjekker endringer fra andre prosesser (CLI-worker, tracking-sync).
+EVENTS_POLL_SEC = float(os.getenv("PACKCHICKEN_EVENTS_POLL_SEC", "5"))
 
 
 def _git_commit_short() -> str:
@@ -82,6 +102,12 @@ def _authorized() -> bool:
     return False
 
 
+@app.teardown_appcontext
+def close_db(_exc: BaseException | None) -> None:
+    # Werkzeug starter en ny tråd per forespørsel, så trådens tilkobling kan ikke gjenbrukes.
+    db.close()
+
+
 @app.before_request
 def require_auth():
     if _authorized():
@@ -115,36 +141,34 @@ def format_ts(value: float | None) -> str:
 
 
 def job_stats() -> Dict[str, int]:
-    with sqlite3.connect(db.DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
-        rows = c.fetchall()
+    c = db.connect().cursor()
+    c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+    rows = c.fetchall()
     return {status or "unknown": count for status, count in rows}
 
 
 def recent_jobs(limit: int = 20) -> list[Dict[str, Any]]:
-    with sqlite3.connect(db.DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute(
-            """
-            SELECT
-                id,
-                order_id,
-                status,
-                created_at,
-                updated_at,
-                tracking_number,
-                tracking_url,
-                shopify_tracking_synced_at,
-                shopify_tracking_sync_error
-            FROM jobs
-            ORDER BY id DESC
-            LIMIT ?
-            """,
-            (limit,),
-        )
-        rows = c.fetchall()
+    c = db.connect().cursor()
+    c.row_factory = sqlite3.Row
+    c.execute(
+        """
+        SELECT
+            id,
+            order_id,
+            status,
+            created_at,
+            updated_at,
+            tracking_number,
+            tracking_url,
+            shopify_tracking_synced_at,
+            shopify_tracking_sync_error
+        FROM jobs
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (limit,),
+    )
+    rows = c.fetchall()
     return [
         {
             "id": row["id"],
@@ -166,29 +190,28 @@ def tracking_jobs(limit: int = 500) -> list[Dict[str, Any]]:
     Hent jobber som har trackingnummer, så alle sporbare pakker blir synlige i GUI.
     """
     lim = max(1, min(int(limit), 5000))
-    with sqlite3.connect(db.DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute(
-            """
-            SELECT
-                id,
-                order_id,
-                status,
-                updated_at,
-                tracking_number,
-                tracking_url,
-                shopify_tracking_synced_at,
-                shopify_tracking_sync_error
-            FROM jobs
-            WHERE tracking_number IS NOT NULL
-              AND tracking_number != ''
-            ORDER BY id DESC
-            LIMIT ?
-            """,
-            (lim,),
-        )
-        rows = c.fetchall()
+    c = db.connect().cursor()
+    c.row_factory = sqlite3.Row
+    c.execute(
+        """
+        SELECT
+            id,
+            order_id,
+            status,
+            updated_at,
+            tracking_number,
+            tracking_url,
+            shopify_tracking_synced_at,
+            shopify_tracking_sync_error
+        FROM jobs
+        WHERE tracking_number IS NOT NULL
+          AND tracking_number != ''
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (lim,),
+    )
+    rows = c.fetchall()
     return [
         {
             "id": row["id"],
@@ -223,17 +246,47 @@ def index():
 @app.get("/api/jobs")
 def api_jobs():
     tracked = tracking_jobs()
-    return jsonify(
-        {
-            "ok": True,
-            "stats": job_stats(),
-            "jobs": recent_jobs(),
-            "tracking_jobs": tracked,
-            "tracking_jobs_count": len(tracked),
-            "orders_dir": str(ORDERS_DIR),
-            "label_dir": str(LABEL_DIR),
-            "app_version": APP_VERSION,
-        }
+    payload = {
+        "ok": True,
+        "stats": job_stats(),
+        "jobs": recent_jobs(),
+        "tracking_jobs": tracked,
+        "tracking_jobs_count": len(tracked),
+    }
+    # Stier/versjon endres bare ved omstart; send dem kun når klientens versjon er utdatert.
+    if request.args.get("app_version") != APP_VERSION:
+        payload["orders_dir"] = str(ORDERS_DIR)
+        payload["label_dir"] = str(LABEL_DIR)
+        payload["app_version"] = APP_VERSION
+    return jsonify(payload)
+
+
+@app.get("/events")
+def events():
+    """
+    Server-sent events: sender en melding når jobbtabellen endres, så dashboardet
+    slipper å polle /api/jobs på timer. Endringer i denne prosessen vekker strømmen
+    med en gang; endringer fra andre prosesser fanges opp via PRAGMA data_version.
+    """
+
+    def stream():
+        version = db.change_version()
+        data_version = db.data_version()
+        yield f"retry: {int(EVENTS_POLL_SEC * 1000)}\n\n"
+        while True:
+            new_version = db.wait_for_change(version, timeout=EVENTS_POLL_SEC)
+            new_data_version = db.data_version()
+            if new_version != version or new_data_version != data_version:
+                version, data_version = new_version, new_data_version
+                yield f"data: {version}\n\n"
+            else:
+                # Kommentar holder tilkoblingen i live og avdekker frakoblede klienter.
+                yield ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -282,17 +335,50 @@ def api_upload():
     if not filename.lower().endswith(".csv"):
         return json_error("Bare CSV-filer støttes.")
 
+    # Hash innholdet mens det skrives; digesten lagres bare i csv_uploads, filen beholder navnet sitt.
+    digest = hashlib.blake2b(digest_size=16)
     destination = ORDERS_DIR / filename
+    partial: Path | None = None
+    written: Path | None = None
     try:
-        file.save(destination)
+        # Unikt midlertidig navn, så samtidige opplastinger av samme fil ikke skriver over hverandre.
+        with tempfile.NamedTemporaryFile(
+            dir=ORDERS_DIR, prefix=f".{filename}.", suffix=".part", delete=False
+        ) as fh:
+            partial = Path(fh.name)
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                fh.write(chunk)
+        hexdigest = digest.hexdigest()
+        os.replace(partial, destination)
+        partial, written = None, destination
+
+        # Samme CSV lastet opp igjen før jobbene er kjørt: ikke legg dem i køen på nytt.
+        previous = db.get_csv_upload(hexdigest)
+        if previous and db.orders_all_pending(previous["order_ids"]):
+            return jsonify(
+                {
+                    "ok": True,
+                    "orders_added": [],
+                    "deduped": True,
+                    "csv_path": str(destination),
+                }
+            )
+
         order_ids = enqueue_orders_from_csv(destination)
+        db.save_csv_upload(hexdigest, destination.name, order_ids)
     except Exception as exc:
+        # Ikke la en halvveis behandlet fil ligge igjen i ORDERS/, der skriptene ville plukket den opp.
+        for leftover in (partial, written):
+            if leftover is not None:
+                leftover.unlink(missing_ok=True)
         return json_error(f"Klarte ikke å enqueue CSV: {exc}", status_code=500)
 
     return jsonify(
         {
             "ok": True,
             "orders_added": order_ids,
+            "deduped": False,
             "csv_path": str(destination),
         }
     )
@@ -306,19 +392,23 @@ def api_process():
     summary["ok"] = True
     summary["test_mode"] = is_test
     summary["return_label"] = return_label
-    # Build download-friendly URLs for merged/single labels
-    def label_url(path_str: str | None) -> str | None:
-        if not path_str:
-            return None
-        p = Path(path_str)
-        if not p.exists():
-            return None
-        return f"/labels/{p.name}"
-
-    summary["merged_label_url"] = label_url(summary.get("merged_label"))
-    summary["label_urls"] = [label_url(p) for p in summary.get("downloaded_labels", []) if label_url(p)]
-    summary["merged_label_name"] = Path(summary["merged_label"]).name if summary.get("merged_label") else None
-    summary["label_names"] = [Path(p).name for p in summary.get("downloaded_labels", [])]
+    # Build download-friendly URLs for merged/single labels.
+    # Én listdir i stedet for Path()/exists() per etikett.
+    existing = set(os.listdir(LABEL_DIR))
+    label_urls: list[str] = []
+    label_names: list[str] = []
+    for path_str in summary.get("downloaded_labels", []):
+        name = os.path.basename(path_str)
+        label_names.append(name)
+        if name in existing:
+            label_urls.append(f"/labels/{name}")
+
+    merged = summary.get("merged_label")
+    merged_name = os.path.basename(merged) if merged else None
+    summary["merged_label_url"] = f"/labels/{merged_name}" if merged_name in existing else None
+    summary["label_urls"] = label_urls
+    summary["merged_label_name"] = merged_name
+    summary["label_names"] = label_names
     return jsonify(summary)
 
 
@@ -622,12 +712,23 @@ INDEX_HTML = """
           <tr><td colspan="7">Ingen jobber ennå.</td></tr>
         </tbody>
       </table>
+      <template id="job-row-tpl">
+        <tr>
+          <td class="job-id"></td>
+          <td class="mono job-order"></td>
+          <td><span class="badge job-status"></span></td>
+          <td class="job-tracking"></td>
+          <td class="job-sync"><span class="badge job-sync-badge"></span></td>
+          <td class="job-created"></td>
+          <td class="job-updated"></td>
+        </tr>
+      </template>
     </section>
 
     <footer>
       <div>ORDERS: {{ orders_dir }}</div>
       <div>LABELS: {{ label_dir }}</div>
-      <div>VERSJON: {{ app_version }}</div>
+      <div>VERSJON: <span id="app-version">{{ app_version }}</span></div>
     </footer>
   </div>
   <div id="log-modal" class="log-modal">
@@ -649,6 +750,7 @@ INDEX_HTML = """
   <script>
     const ordersDir = {{ orders_dir|tojson }};
     const labelDir = {{ label_dir|tojson }};
+    let appVersion = {{ app_version|tojson }};
     const fileInput = document.getElementById('file-input');
     const fileLabel = document.getElementById('file-label');
     const filePicker = document.getElementById('file-picker');
@@ -685,9 +787,13 @@ INDEX_HTML = """
 
     async function loadJobs() {
       try {
-        const res = await fetch('/api/jobs');
+        const res = await fetch(`/api/jobs?app_version=${encodeURIComponent(appVersion)}`);
         const data = await res.json();
         if (!data.ok) { throw new Error(data.error || 'Ukjent feil'); }
+        if (data.app_version) {
+          appVersion = data.app_version;
+          document.getElementById('app-version').textContent = appVersion;
+        }
         renderStats(data.stats || {});
         renderJobs(data.jobs || []);
         renderTrackingJobs(data.tracking_jobs || []);
@@ -729,6 +835,8 @@ INDEX_HTML = """
       `;
     }
 
+    const jobRowTpl = document.getElementById('job-row-tpl');
+
     function renderJobs(jobs) {
       const body = document.getElementById('jobs-body');
       const countEl = document.getElementById('job-count');
@@ -737,55 +845,62 @@ INDEX_HTML = """
         body.innerHTML = '<tr><td colspan="7">Ingen jobber ennå.</td></tr>';
         return;
       }
-      function esc(value) {
-        return String(value ?? '')
-          .replaceAll('&', '&amp;')
-          .replaceAll('<', '&lt;')
-          .replaceAll('>', '&gt;')
-          .replaceAll('"', '&quot;')
-          .replaceAll("'", '&#39;');
-      }
-      body.innerHTML = jobs.map(row => {
+      // Klon ferdig parset rad-mal og fyll med textContent (ingen HTML-parsing per poll)
+      const frag = new DocumentFragment();
+      for (const row of jobs) {
+        const tr = jobRowTpl.content.firstElementChild.cloneNode(true);
         const status = (row.status || '').toLowerCase();
-        let badgeClass = 'badge';
-        if (status === 'failed') badgeClass += ' fail';
-        if (status === 'done') badgeClass += ' done';
+        tr.querySelector('.job-id').textContent = row.id;
+        tr.querySelector('.job-order').textContent = row.order_id || '';
+        const statusEl = tr.querySelector('.job-status');
+        statusEl.textContent = row.status || '';
+        if (status === 'failed') statusEl.classList.add('fail');
+        if (status === 'done') statusEl.classList.add('done');
+
         const trackingNumber = row.tracking_number || '';
-        const trackingCell = trackingNumber
-          ? `<div class="mono">${esc(trackingNumber)}</div>`
-          : `<span class="subtle">Ikke boket ennå</span>`;
+        const trackingEl = document.createElement(trackingNumber ? 'div' : 'span');
+        trackingEl.className = trackingNumber ? 'mono' : 'subtle';
+        trackingEl.textContent = trackingNumber || 'Ikke boket ennå';
+        tr.querySelector('.job-tracking').appendChild(trackingEl);
 
         const syncError = (row.shopify_tracking_sync_error || '').trim();
         const syncedAt = row.shopify_tracking_synced_at || '';
-        let syncBadge = '<span class="badge">Ikke startet</span>';
+        let syncText = 'Ikke startet';
+        let syncTone = '';
         let syncSubtext = '';
         if (syncedAt) {
-          syncBadge = '<span class="badge done">Sendt</span>';
-          syncSubtext = `<div class="subtle">${esc(syncedAt)}</div>`;
+          syncText = 'Sendt';
+          syncTone = 'done';
+          syncSubtext = syncedAt;
         } else if (syncError) {
           const lowerErr = syncError.toLowerCase();
           if (lowerErr.includes('ikke fulfilled ennå') || lowerErr.includes('ikke fulfilled')) {
-            syncBadge = '<span class="badge wait">Venter på fulfill</span>';
+            syncText = 'Venter på fulfill';
+            syncTone = 'wait';
           } else {
-            syncBadge = '<span class="badge warn">Sync-feil</span>';
+            syncText = 'Sync-feil';
+            syncTone = 'warn';
           }
-          syncSubtext = `<div class="subtle">${esc(syncError)}</div>`;
+          syncSubtext = syncError;
         } else if (trackingNumber && status === 'done') {
-          syncBadge = '<span class="badge wait">Klar for sync</span>';
+          syncText = 'Klar for sync';
+          syncTone = 'wait';
+        }
+        const syncBadge = tr.querySelector('.job-sync-badge');
+        syncBadge.textContent = syncText;
+        if (syncTone) syncBadge.classList.add(syncTone);
+        if (syncSubtext) {
+          const sub = document.createElement('div');
+          sub.className = 'subtle';
+          sub.textContent = syncSubtext;
+          tr.querySelector('.job-sync').appendChild(sub);
         }
 
-        return `
-          <tr>
-            <td>${row.id}</td>
-            <td class="mono">${esc(row.order_id || '')}</td>
-            <td><span class="${badgeClass}">${esc(row.status || '')}</span></td>
-            <td>${trackingCell}</td>
-            <td>${syncBadge}${syncSubtext}</td>
-            <td>${esc(row.created_at || '')}</td>
-            <td>${esc(row.updated_at || '')}</td>
-          </tr>
-        `;
-      }).join('');
+        tr.querySelector('.job-created').textContent = row.created_at || '';
+        tr.querySelector('.job-updated').textContent = row.updated_at || '';
+        frag.appendChild(tr);
+      }
+      body.replaceChildren(frag);
     }
 
     function renderTrackingJobs(rows) {
@@ -992,8 +1107,19 @@ INDEX_HTML = """
       }
     });
 
+    // Last jobber på nytt kun når serveren melder endring (samler raske endringer til én henting)
+    let reloadTimer = null;
+    function scheduleLoadJobs() {
+      if (reloadTimer) return;
+      reloadTimer = setTimeout(() => { reloadTimer = null; loadJobs(); }, 300);
+    }
+
     loadJobs();
-    setInterval(loadJobs, 8000);
+    if (window.EventSource) {
+      new EventSource('/events').onmessage = scheduleLoadJobs;
+    } else {
+      setInterval(loadJobs, 8000);
+    }
   </script>
 </body>
 </html>
@@ -1,9 +1,125 @@
-import sqlite3, json, time
+import sqlite3, threading, time
+from contextlib import contextmanager
 from pathlib import Path
 
+from packchicken.utils import fastjson
+from packchicken.utils.logging import get_logger
+
 # Filen packchicken.db vil ligge i rotmappen til prosjektet
 DB_PATH = Path(__file__).resolve().parents[2] / "packchicken.db"
 
+# Minnemappet I/O og større sidecache slik at hele jobs-tabellen leses fra minne.
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+PAGE_SIZE = 8192
+BUSY_TIMEOUT_MS = 5000
+# Jobber som har stått 'claimed' lenger enn dette uten endring regnes som forlatt
+# (worker drept midt i en batch). En batch tar sekunder, så marginen er romslig.
+STALE_CLAIM_SEC = 15 * 60
+
+log = get_logger("packchicken.db")
+
+# Én tilkobling per tråd, gjenbrukt på tvers av kall (ingen open/close per spørring).
+_local = threading.local()
+
+# Endringsteller som lyttere i samme prosess (GUI-ens /events) kan vente på.
+_changed = threading.Condition()
+_change_version = 0
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Returner trådens vedvarende tilkobling til DB_PATH (opprettes ved første kall).
+    Tilkoblingen kjører i autocommit; skriv grupperes med _write_txn().
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+    if conn is not None:
+        conn.close()
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    _local.conn = conn
+    _local.path = DB_PATH
+    return conn
+
+
+def close() -> None:
+    """
+    Lukk trådens tilkobling hvis den finnes. Brukes der hver tråd bare lever kort
+    (én tråd per forespørsel i Flask), så tilkoblingen ikke blir hengende til GC.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+
+@contextmanager
+def _write_txn():
+    """BEGIN IMMEDIATE ... COMMIT på trådens tilkobling (ROLLBACK ved feil)."""
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    _notify_changed()
+
+
+def _notify_changed() -> None:
+    global _change_version
+    with _changed:
+        _change_version += 1
+        _changed.notify_all()
+
+
+def change_version() -> int:
+    """Antall skrivetransaksjoner committet i denne prosessen."""
+    return _change_version
+
+
+def wait_for_change(last_version: int, timeout: float) -> int:
+    """Blokker til en skriving er committet i denne prosessen (eller timeout); returner versjonen."""
+    with _changed:
+        _changed.wait_for(lambda: _change_version != last_version, timeout)
+        return _change_version
+
+
+def data_version() -> int:
+    """PRAGMA data_version: endres når en annen tilkobling (også andre prosesser) har committet."""
+    return connect().execute("PRAGMA data_version").fetchone()[0]
+
+
+def wait_for_job(timeout: float, check_interval: float = 0.25) -> bool:
+    """
+    Vent til køen kan ha fått nye jobber, i stedet for å sove blindt.
+    Skriving i denne prosessen vekker umiddelbart; skriving fra andre prosesser
+    (f.eks. enqueue-skriptet) oppdages via data_version hvert check_interval.
+    Returnerer False ved timeout, så kalleren kan polle som fallback.
+    """
+    version = _change_version
+    start_data_version = data_version()
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if wait_for_change(version, min(check_interval, remaining)) != version:
+            return True
+        if data_version() != start_data_version:
+            return True
+
+
+_dumps = fastjson.dumps
+_loads = fastjson.loads
+
 
 def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str) -> None:
     c = conn.cursor()
@@ -15,8 +131,12 @@ def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str)
 
 def init_db():
     """Opprett tabellen jobs hvis den ikke finnes"""
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
+    conn = connect()
+    # page_size gjelder kun for nye DB-er; journal_mode=WAL lagres i filen.
+    # Begge må settes utenfor en transaksjon.
+    conn.execute(f"PRAGMA page_size={PAGE_SIZE}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    with _write_txn() as c:
         c.execute("""
         CREATE TABLE IF NOT EXISTS jobs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -32,46 +152,120 @@ def init_db():
         )
         """)
         # Migrer eldre DB-er med manglende felt.
-        _ensure_column(conn, "jobs", "tracking_number", "tracking_number TEXT")
-        _ensure_column(conn, "jobs", "tracking_url", "tracking_url TEXT")
-        _ensure_column(conn, "jobs", "shopify_tracking_synced_at", "shopify_tracking_synced_at REAL")
-        _ensure_column(conn, "jobs", "shopify_tracking_sync_error", "shopify_tracking_sync_error TEXT")
-        conn.commit()
+        _ensure_column(c.connection, "jobs", "tracking_number", "tracking_number TEXT")
+        _ensure_column(c.connection, "jobs", "tracking_url", "tracking_url TEXT")
+        _ensure_column(c.connection, "jobs", "shopify_tracking_synced_at", "shopify_tracking_synced_at REAL")
+        _ensure_column(c.connection, "jobs", "shopify_tracking_sync_error", "shopify_tracking_sync_error TEXT")
+        # Køuttrekk (status='pending' ORDER BY id) slår opp via indeks i stedet for full skanning.
+        c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_id ON jobs(status, id)")
+        # Opplastede CSV-er (BLAKE2-digest) slik at identiske filer ikke enqueues på nytt.
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS csv_uploads (
+            digest TEXT PRIMARY KEY,
+            filename TEXT,
+            order_ids TEXT,
+            created_at REAL
+        )
+        """)
+
+    recover_stale_claims()
+
+
+def recover_stale_claims(max_age: float = STALE_CLAIM_SEC) -> tuple[int, int]:
+    """
+    Rydd opp i jobber som ble liggende som 'claimed' etter at en worker ble drept.
+    Har jobben tracking, ble den booket: sett 'done'. Ellers legges den tilbake som 'pending'.
+    Bare eldre claims røres, så en annen worker som er midt i en batch ikke påvirkes.
+    Returnerer (antall satt til done, antall lagt tilbake i køen).
+    """
+    now = time.time()
+    cutoff = now - max_age
+    with _write_txn() as c:
+        c.execute(
+            """
+            UPDATE jobs SET status=CASE WHEN tracking_number IS NOT NULL AND tracking_number != ''
+                                        THEN 'done' ELSE 'pending' END,
+                            updated_at=?
+            WHERE status='claimed' AND COALESCE(updated_at, 0) < ?
+            RETURNING status
+            """,
+            (now, cutoff),
+        )
+        statuses = [status for (status,) in c.fetchall()]
+    done = statuses.count("done")
+    requeued = statuses.count("pending")
+    if statuses:
+        log.warning(
+            "Fant %d forlatte 'claimed'-jobber: %d satt til done (har tracking), %d lagt tilbake i køen",
+            len(statuses), done, requeued,
+        )
+    return done, requeued
+
 
 def add_job(order_dict):
     """Legg til en ny jobb basert på en ordre"""
-    payload = json.dumps(order_dict)
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
+    payload = _dumps(order_dict)
+    with _write_txn() as c:
         c.execute(
             "INSERT INTO jobs (order_id, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
             (order_dict.get("id"), payload, time.time(), time.time()),
         )
-        conn.commit()
+
+def add_jobs_bulk(order_dicts):
+    """Legg til mange jobber i én transaksjon (én commit for hele batchen)"""
+    now = time.time()
+    rows = [(order_dict.get("id"), _dumps(order_dict), now, now) for order_dict in order_dicts]
+    if not rows:
+        return
+    with _write_txn() as c:
+        c.executemany(
+            "INSERT INTO jobs (order_id, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+def get_next_jobs(limit: int = 16):
+    """
+    Reserver opptil `limit` pending jobber atomisk (status -> 'claimed') i én transaksjon.
+    To samtidige kall kan dermed aldri få samme jobb.
+    """
+    lim = max(1, int(limit))
+    with _write_txn() as c:
+        c.execute(
+            """
+            UPDATE jobs SET status='claimed', updated_at=?
+            WHERE id IN (SELECT id FROM jobs WHERE status='pending' ORDER BY id LIMIT ?)
+            RETURNING id, payload
+            """,
+            (time.time(), lim),
+        )
+        rows = c.fetchall()
+    # RETURNING garanterer ikke rekkefølge; behold køens id-rekkefølge.
+    rows.sort()
+    return [(job_id, _loads(payload)) for job_id, payload in rows]
 
 def get_next_job():
-    """Hent neste jobb med status pending"""
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, payload FROM jobs WHERE status='pending' ORDER BY id LIMIT 1")
-        row = c.fetchone()
-    if not row:
-        return None
-    job_id, payload = row
-    return job_id, json.loads(payload)
+    """Reserver neste pending jobb, eller None hvis køen er tom"""
+    jobs = get_next_jobs(1)
+    return jobs[0] if jobs else None
 
 def update_status(job_id, status):
     """Oppdater statusen til en jobb"""
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
+    with _write_txn() as c:
         c.execute("UPDATE jobs SET status=?, updated_at=? WHERE id=?", (status, time.time(), job_id))
-        conn.commit()
+
+def update_status_bulk(updates):
+    """Oppdater status for mange jobber, gitt som (job_id, status), i én transaksjon"""
+    now = time.time()
+    rows = [(status, now, job_id) for job_id, status in updates]
+    if not rows:
+        return
+    with _write_txn() as c:
+        c.executemany("UPDATE jobs SET status=?, updated_at=? WHERE id=?", rows)
 
 
 def save_tracking(job_id, tracking_number: str, tracking_url: str | None = None):
     """Lagre tracking-info fra Bring på jobben."""
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
+    with _write_txn() as c:
         c.execute(
             """
             UPDATE jobs
@@ -84,7 +278,6 @@ def save_tracking(job_id, tracking_number: str, tracking_url: str | None = None)
             """,
             (tracking_number, tracking_url, time.time(), job_id),
         )
-        conn.commit()
 
 
 def get_jobs_pending_tracking_sync(limit: int = 50):
@@ -92,29 +285,27 @@ def get_jobs_pending_tracking_sync(limit: int = 50):
     Hent ferdige jobber med tracking som ikke er synket til Shopify ennå.
     """
     lim = max(1, min(int(limit), 500))
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute(
-            """
-            SELECT id, order_id, payload, tracking_number, tracking_url, shopify_tracking_sync_error
-            FROM jobs
-            WHERE status='done'
-              AND tracking_number IS NOT NULL
-              AND tracking_number != ''
-              AND shopify_tracking_synced_at IS NULL
-            ORDER BY id ASC
-            LIMIT ?
-            """,
-            (lim,),
-        )
-        rows = c.fetchall()
+    c = connect().cursor()
+    c.row_factory = sqlite3.Row
+    c.execute(
+        """
+        SELECT id, order_id, payload, tracking_number, tracking_url, shopify_tracking_sync_error
+        FROM jobs
+        WHERE status='done'
+          AND tracking_number IS NOT NULL
+          AND tracking_number != ''
+          AND shopify_tracking_synced_at IS NULL
+        ORDER BY id ASC
+        LIMIT ?
+        """,
+        (lim,),
+    )
+    rows = c.fetchall()
     return [dict(r) for r in rows]
 
 
 def mark_tracking_synced(job_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
+    with _write_txn() as c:
         c.execute(
             """
             UPDATE jobs
@@ -125,12 +316,10 @@ def mark_tracking_synced(job_id: int):
             """,
             (time.time(), time.time(), job_id),
         )
-        conn.commit()
 
 
 def mark_tracking_sync_error(job_id: int, error_message: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
+    with _write_txn() as c:
         c.execute(
             """
             UPDATE jobs
@@ -140,4 +329,44 @@ def mark_tracking_sync_error(job_id: int, error_message: str):
             """,
             (str(error_message)[:2000], time.time(), job_id),
         )
-        conn.commit()
+
+
+def get_csv_upload(digest: str):
+    """Hent tidligere opplasting med samme innholds-digest, eller None."""
+    c = connect().cursor()
+    c.execute("SELECT filename, order_ids FROM csv_uploads WHERE digest=?", (digest,))
+    row = c.fetchone()
+    if not row:
+        return None
+    filename, order_ids = row
+    return {"digest": digest, "filename": filename, "order_ids": _loads(order_ids or "[]")}
+
+
+def save_csv_upload(digest: str, filename: str, order_ids: list[str]):
+    """Registrer en opplastet CSV og ordrene den la inn."""
+    with _write_txn() as c:
+        c.execute(
+            """
+            INSERT INTO csv_uploads (digest, filename, order_ids, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(digest) DO UPDATE SET
+                filename=excluded.filename,
+                order_ids=excluded.order_ids,
+                created_at=excluded.created_at
+            """,
+            (digest, filename, _dumps(order_ids), time.time()),
+        )
+
+
+def orders_all_pending(order_ids: list[str]) -> bool:
+    """True hvis alle ordrene fortsatt har en jobb i køen som ikke er ferdig (pending eller under booking)."""
+    ids = [str(oid) for oid in order_ids]
+    if not ids:
+        return False
+    placeholders = ",".join("?" * len(ids))
+    c = connect().cursor()
+    c.execute(
+        f"SELECT COUNT(DISTINCT order_id) FROM jobs WHERE status IN ('pending','claimed') AND order_id IN ({placeholders})",
+        ids,
+    )
+    (count,) = c.fetchone()
+    return count == len(set(ids))
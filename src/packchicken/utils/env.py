@@ -0,0 +1,30 @@
+"""
+packchicken.utils.env
+
+Felles lasting av .env-filer. GUI, worker og Bring-klient ser etter de samme filene
+ved import; hver fil leses og parses bare én gang per prosess.
+"""
+
+from pathlib import Path
+from typing import Iterable
+
+from dotenv import load_dotenv
+
+_ENV_LOADED: set[Path] = set()
+
+
+def load_env_files(candidates: Iterable[Path | str], first_only: bool = False) -> None:
+    """
+    Laster de kandidatfilene som finnes, uten å overstyre allerede satte miljøvariabler.
+    first_only=True stopper etter første fil som finnes (også om den er lastet fra før).
+    """
+    for candidate in candidates:
+        path = Path(candidate)
+        if not path.exists():
+            continue
+        key = path.resolve()
+        if key not in _ENV_LOADED:
+            _ENV_LOADED.add(key)
+            load_dotenv(key, override=False)
+        if first_only:
+            break
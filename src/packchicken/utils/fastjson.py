@@ -0,0 +1,36 @@
+"""
+packchicken.utils.fastjson
+
+Felles JSON-koding: orjson (C-utvidelse) når den er installert, ellers stdlib json.
+Begge gir kompakt JSON uten ASCII-escaping, så DB, logger og API-kall ser like ut.
+"""
+
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # valgfri: faller tilbake til stdlib json
+    orjson = None
+
+HAVE_ORJSON = orjson is not None
+
+
+def dumps_bytes(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """JSON som UTF-8-bytes (f.eks. HTTP-body)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    """JSON som str (f.eks. DB-kolonner og logglinjer)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default).decode("utf-8")
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,22 +1,34 @@
 from __future__ import annotations
 
-import json
 import logging
 import sys
-from datetime import datetime
+import time
+
+from packchicken.utils import fastjson
 
 
 class JsonFormatter(logging.Formatter):
+    # (sekund, formatert prefiks) gjenbrukes for alle logglinjer innen samme sekund.
+    _ts_cache: tuple[int, str] = (-1, "")
+
+    def _timestamp(self, created: float) -> str:
+        sec = int(created)
+        cached_sec, prefix = self._ts_cache
+        if sec != cached_sec:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+            self._ts_cache = (sec, prefix)
+        return f"{prefix}.{int((created - sec) * 1000):03d}Z"
+
     def format(self, record: logging.LogRecord) -> str:
         payload = {
-            "ts": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+            "ts": self._timestamp(record.created),
             "level": record.levelname,
             "name": record.name,
             "message": record.getMessage(),
         }
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(payload, ensure_ascii=False)
+        return fastjson.dumps(payload)
 
 
 def setup_logging(level: str | None = None, json_output: bool = False) -> None:
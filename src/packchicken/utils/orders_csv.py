@@ -7,63 +7,86 @@ from typing import Any, Dict, Iterable
 
 from packchicken.utils import db
 
+# Antall jobber per INSERT-batch, så store CSV-er ikke holder alt i minnet.
+BULK_INSERT_CHUNK = 5000
+
+
+TRUE_VALUES = frozenset({"true", "1", "yes", "y"})
+
+# Rader leses som lister; kolonneindekser slås opp fra headeren én gang per fil.
+Row = list[str]
+ColumnIndex = Dict[str, int]
+
 
 def parse_bool(val: str) -> bool:
-    return str(val).strip().lower() in {"true", "1", "yes", "y"}
+    return str(val).strip().lower() in TRUE_VALUES
+
+
+def column_index(header: Row) -> ColumnIndex:
+    return {name: i for i, name in enumerate(header)}
+
+
+def _get(row: Row, idx: ColumnIndex, name: str) -> str | None:
+    # Samme semantikk som DictReader.get: None for manglende kolonne/kort rad.
+    i = idx.get(name)
+    if i is None or i >= len(row):
+        return None
+    return row[i]
 
 
-def row_to_line_item(row: Dict[str, str]) -> Dict[str, Any]:
+def row_to_line_item(row: Row, idx: ColumnIndex) -> Dict[str, Any]:
+    grams = _get(row, idx, "Lineitem grams")
     return {
-        "title": row.get("Lineitem name"),
-        "quantity": int(row.get("Lineitem quantity") or 1),
-        "price": row.get("Lineitem price"),
-        "sku": row.get("Lineitem sku"),
-        "requires_shipping": parse_bool(row.get("Lineitem requires shipping")),
-        "grams": int(row.get("Lineitem grams") or 0) if row.get("Lineitem grams") else 0,
+        "title": _get(row, idx, "Lineitem name"),
+        "quantity": int(_get(row, idx, "Lineitem quantity") or 1),
+        "price": _get(row, idx, "Lineitem price"),
+        "sku": _get(row, idx, "Lineitem sku"),
+        "requires_shipping": parse_bool(_get(row, idx, "Lineitem requires shipping")),
+        "grams": int(grams) if grams else 0,
     }
 
 
-def pick_address(rows: list[Dict[str, str]], prefix: str) -> Dict[str, Any]:
+def pick_address(rows: list[Row], idx: ColumnIndex, prefix: str) -> Dict[str, Any]:
     for row in rows:
-        if row.get(f"{prefix} Address1") or row.get(f"{prefix} City") or row.get(f"{prefix} Zip"):
+        if _get(row, idx, f"{prefix} Address1") or _get(row, idx, f"{prefix} City") or _get(row, idx, f"{prefix} Zip"):
             return {
-                "name": row.get(f"{prefix} Name") or row.get("Name"),
-                "address1": row.get(f"{prefix} Address1") or row.get(f"{prefix} Street"),
-                "address2": row.get(f"{prefix} Address2") or "",
-                "city": row.get(f"{prefix} City") or "",
-                "zip": row.get(f"{prefix} Zip") or "",
-                "country_code": row.get(f"{prefix} Country") or "NO",
-                "phone": row.get(f"{prefix} Phone") or row.get("Phone"),
-                "email": row.get("Email"),
+                "name": _get(row, idx, f"{prefix} Name") or _get(row, idx, "Name"),
+                "address1": _get(row, idx, f"{prefix} Address1") or _get(row, idx, f"{prefix} Street"),
+                "address2": _get(row, idx, f"{prefix} Address2") or "",
+                "city": _get(row, idx, f"{prefix} City") or "",
+                "zip": _get(row, idx, f"{prefix} Zip") or "",
+                "country_code": _get(row, idx, f"{prefix} Country") or "NO",
+                "phone": _get(row, idx, f"{prefix} Phone") or _get(row, idx, "Phone"),
+                "email": _get(row, idx, "Email"),
             }
     return {
-        "name": rows[0].get("Name"),
+        "name": _get(rows[0], idx, "Name"),
         "address1": "",
         "address2": "",
         "city": "",
         "zip": "",
         "country_code": "NO",
-        "phone": rows[0].get("Phone"),
-        "email": rows[0].get("Email"),
+        "phone": _get(rows[0], idx, "Phone"),
+        "email": _get(rows[0], idx, "Email"),
     }
 
 
-def rows_to_job(rows: list[Dict[str, str]]) -> Dict[str, Any]:
+def rows_to_job(rows: list[Row], idx: ColumnIndex) -> Dict[str, Any]:
     first = rows[0]
-    order_id = first.get("Id") or first.get("Name")
+    order_id = _get(first, idx, "Id") or _get(first, idx, "Name")
     location_id = os.getenv("SHOPIFY_LOCATION")
-    shipping = pick_address(rows, "Shipping")
-    billing = pick_address(rows, "Billing")
-    line_items = [row_to_line_item(r) for r in rows]
+    shipping = pick_address(rows, idx, "Shipping")
+    billing = pick_address(rows, idx, "Billing")
+    line_items = [row_to_line_item(r, idx) for r in rows]
 
     return {
         "id": order_id,
         "source": "csv",
         "order": {
             "id": order_id,
-            "order_number": first.get("Name"),
-            "email": first.get("Email"),
-            "phone": first.get("Phone"),
+            "order_number": _get(first, idx, "Name"),
+            "email": _get(first, idx, "Email"),
+            "phone": _get(first, idx, "Phone"),
             "shipping_address": shipping,
             "billing_address": billing,
             "line_items": line_items,
@@ -76,20 +99,26 @@ def enqueue_orders_from_csv(path: Path) -> list[str]:
     if not path.exists():
         raise FileNotFoundError(path)
 
-    grouped: dict[str, list[Dict[str, str]]] = {}
+    grouped: dict[str, list[Row]] = {}
     with path.open(newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        idx = column_index(next(reader, []))
         for row in reader:
-            key = row.get("Id") or row.get("Name")
+            key = _get(row, idx, "Id") or _get(row, idx, "Name")
             if not key:
                 continue
             grouped.setdefault(key, []).append(row)
 
     created: list[str] = []
+    batch: list[Dict[str, Any]] = []
     for rows in grouped.values():
-        job_data = rows_to_job(rows)
-        db.add_job(job_data)
+        job_data = rows_to_job(rows, idx)
+        batch.append(job_data)
         created.append(str(job_data["id"]))
+        if len(batch) >= BULK_INSERT_CHUNK:
+            db.add_jobs_bulk(batch)
+            batch.clear()
+    db.add_jobs_bulk(batch)
     return created
 
 
@@ -4,22 +4,77 @@ packchicken.utils.pdf
 Kun sammenslåing av ekte Bring-PDF-er (ingen mock-etiketter genereres).
 """
 
+import queue
+import shutil
+import threading
 from pathlib import Path
-from pypdf import PdfReader, PdfWriter
+from typing import BinaryIO, Optional
 
+from pypdf import PdfWriter
 
-def combine_pdfs(input_paths: list[Path], output_path: Path) -> Path:
+
+class ProgressiveMerger:
     """
-    Slår sammen flere PDF-filer til én.
+    Slår sammen etiketter fortløpende i en egen tråd mens nye jobber bookes,
+    slik at bare selve skrivingen gjenstår når siste etikett er lastet ned.
+    Etiketter kan gis som fil eller som minnebuffer (da skrives de aldri til disk,
+    med mindre sammenslåingen feiler og spill() kalles).
     """
-    writer = PdfWriter()
-    for path in input_paths:
-        if not Path(path).exists():
-            continue
-        reader = PdfReader(str(path))
-        for page in reader.pages:
-            writer.add_page(page)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "wb") as fh:
-        writer.write(fh)
-    return output_path
+
+    _STOP = object()
+
+    def __init__(self) -> None:
+        self._writer = PdfWriter()
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._buffers: list[tuple[Path, BinaryIO]] = []
+        self.count = 0
+        self._thread = threading.Thread(target=self._run, name="packchicken-merge", daemon=True)
+        self._thread.start()
+
+    def add(self, path: Path, buffer: Optional[BinaryIO] = None) -> None:
+        if buffer is not None:
+            self._buffers.append((path, buffer))
+        self._queue.put((path, buffer))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            path, buffer = item
+            if self._error is not None or (buffer is None and not Path(path).exists()):
+                continue
+            try:
+                self._writer.append(buffer if buffer is not None else str(path))
+                self.count += 1
+            except BaseException as exc:  # rapporteres fra close()
+                self._error = exc
+
+    def close(self, output_path: Optional[Path]) -> Optional[Path]:
+        """
+        Venter på køen og skriver resultatet til output_path (None = forkast).
+        Kaster feilen fra merge-tråden hvis en etikett ikke kunne leses.
+        """
+        self._queue.put(self._STOP)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if output_path is None or not self.count:
+            return None
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "wb") as fh:
+            self._writer.write(fh)
+        self._buffers.clear()
+        return output_path
+
+    def spill(self) -> list[Path]:
+        """Skriver etiketter som bare finnes i minnet til sine filstier (brukes når sammenslåing feiler)."""
+        written: list[Path] = []
+        for path, buffer in self._buffers:
+            buffer.seek(0)
+            with open(path, "wb") as fh:
+                shutil.copyfileobj(buffer, fh)
+            written.append(path)
+        self._buffers.clear()
+        return written
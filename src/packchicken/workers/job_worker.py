@@ -9,20 +9,29 @@ Kjør slik:
     uv run src/packchicken/workers/job_worker.py
 """
 
+import atexit
+import contextlib
+import functools
+import io
 import os
 import time
 import json
 import logging
 import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, Optional
+from typing import Any, BinaryIO, Callable, Dict, Optional
 
 import requests
-from dotenv import load_dotenv
 
 from packchicken.utils import db
-from packchicken.utils.pdfmerger import combine_pdfs
+from packchicken.utils.env import load_env_files
+from packchicken.utils.pdfmerger import ProgressiveMerger
 from packchicken.clients.bring_client import BringClient, BringError
 from packchicken.clients.shopify_client import ShopifyClient
 
@@ -30,10 +39,8 @@ from packchicken.clients.shopify_client import ShopifyClient
 # Konfig
 # ------------------------------------------------------------
 
-for candidate in (Path(".env"), Path("secrets.env"), Path("../.env"), Path("../secrets.env")):
-    if candidate.exists():
-        # Ikke overstyr allerede satte miljøvariabler (f.eks. fra shell)
-        load_dotenv(candidate, override=False)
+# Ikke overstyr allerede satte miljøvariabler (f.eks. fra shell)
+load_env_files((".env", "secrets.env", "../.env", "../secrets.env"))
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FILE = os.getenv("LOG_FILE")  # sett til filsti for å logge til fil i tillegg til stdout
@@ -47,20 +54,77 @@ logging.basicConfig(
     handlers=handlers,
 )
 
+log = logging.getLogger(__name__)
+
 LABEL_DIR = Path(os.getenv("LABEL_DIR", "./LABELS")).resolve()
 LABEL_DIR.mkdir(parents=True, exist_ok=True)
 
+# Antall jobber som reserveres og statusoppdateres samlet per runde.
+JOB_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "16"))
+# Antall jobber i en batch som bookes samtidig (HTTP-kallene mot Bring/Shopify overlapper).
+WORKER_CONCURRENCY = max(1, int(os.getenv("WORKER_CONCURRENCY", "8")))
+# Maks tid (sekunder) ferdige statuser i en batch holdes tilbake før de skrives samlet.
+STATUS_FLUSH_SEC = float(os.getenv("WORKER_STATUS_FLUSH_SEC", "1.0"))
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Booking-innstillinger som leses fra miljøet én gang ved oppstart i stedet for per jobb."""
+
+    product_id: str
+    additional_service_id: str
+    return_email: Optional[str]
+    return_phone: Optional[str]
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        return cls(
+            product_id=os.getenv("BRING_PRODUCT_ID", "3584"),
+            additional_service_id=os.getenv("BRING_ADDITIONAL_SERVICE_ID", "1081"),
+            return_email=os.getenv("BRING_RETURN_EMAIL"),
+            return_phone=os.getenv("BRING_RETURN_PHONE"),
+        )
+
+
+# BRING_TEST_INDICATOR leses fortsatt direkte, siden process_all_pending_jobs kan bytte den underveis.
+CFG = Config.from_env()
+
+
+def reload_settings() -> None:
+    """
+    Leser miljøavhengige innstillinger på nytt: CFG, avsender/retur-adressene og
+    booking-skjelettene som er bygget fra dem. Kalles ved starten av hver kjøring.
+    """
+    global CFG
+    CFG = Config.from_env()
+    sender_from_env.cache_clear()
+    return_to_from_env.cache_clear()
+    booking_skeleton.cache_clear()
+
+
+# Bufferstørrelse ved kopiering av etikett-PDF fra HTTP-strømmen til disk.
+LABEL_COPY_BUFSIZE = 1024 * 1024
+# (connect, read) sekunder for etikettnedlasting; rask feil hvis CDN-et ikke svarer.
+LABEL_TIMEOUT = (5, 30)
+
 DRY_RUN = False  # Alltid kjør ekte booking; bruk BRING_TEST_INDICATOR for test-label
 DOWNLOADED_LABELS: list[Path] = []
 PROCESS_ERRORS: list[str] = []
+_RESULTS_LOCK = threading.Lock()
+
+
+# Enkle filnavn: behold bokstaver, tall, punktum, underscore, bindestrek og # for ordrenr.
+SLUG_RE = re.compile(r"[^A-Za-z0-9._#-]+")
 
 
 def safe_slug(value: str) -> str:
-    # Enkle filnavn: behold bokstaver, tall, punktum, underscore, bindestrek og # for ordrenr.
-    slug = re.sub(r"[^A-Za-z0-9._#-]+", "-", value.strip())
+    slug = SLUG_RE.sub("-", value.strip())
     slug = slug.strip("-._")
     return slug or "order"
 
+# Avsender/retur bygges én gang og deles mellom jobbene (og trådene); må ikke muteres.
+# reload_settings() tømmer cachen slik at endrede miljøvariabler plukkes opp per kjøring.
+@functools.lru_cache(maxsize=1)
 def sender_from_env() -> Dict[str, Any]:
     return {
         "name": os.getenv("BRING_SENDER_NAME", "PackChicken Sender"),
@@ -78,6 +142,7 @@ def sender_from_env() -> Dict[str, Any]:
     }
 
 
+@functools.lru_cache(maxsize=1)
 def return_to_from_env() -> Dict[str, Any]:
     return {
         "name": os.getenv("BRING_RETURN_NAME", "PackChicken Return"),
@@ -93,36 +158,50 @@ def return_to_from_env() -> Dict[str, Any]:
         },
     }
 
-DEFAULT_PACKAGE = {
+# Skrivebeskyttet mal; build_package lager en ny dict per jobb med {**DEFAULT_PACKAGE, ...}.
+# dimensions deles mellom pakkene, men Bring-klienten kopierer feltene ut i payloaden.
+DEFAULT_PACKAGE = MappingProxyType({
     "weightInKg": float(os.getenv("BRING_WEIGHT_KG", "1.1")),
-    "dimensions": {
+    "dimensions": MappingProxyType({
         "lengthInCm": int(os.getenv("BRING_LENGTH_CM", "23")),
         "widthInCm": int(os.getenv("BRING_WIDTH_CM", "10")),
         "heightInCm": int(os.getenv("BRING_HEIGHT_CM", "13")),
-    },
+    }),
     "goodsDescription": os.getenv("BRING_GOODS_DESCRIPTION", "PackChicken shipment"),
     "packageType": os.getenv("BRING_PACKAGE_TYPE"),
-}
+})
+
+def _name(addr: Dict[str, Any]) -> str:
+    name = addr.get("name")
+    if name:
+        return name
+    first, last = addr.get("first_name"), addr.get("last_name")
+    if first and last:
+        return f"{first} {last}"
+    return first or last or ""
+
 
 def build_recipient(order: Dict[str, Any]) -> Dict[str, Any]:
     shipping = order.get("shipping_address") or {}
-    billing = order.get("billing_address") or {}
-    def _name(addr: Dict[str, Any]) -> str:
-        return (
-            addr.get("name")
-            or " ".join(filter(None, [addr.get("first_name"), addr.get("last_name")]))
-            or ""
-        )
-    name = order.get("name") or _name(shipping) or _name(billing) or "Ukjent mottaker"
-    # Bruk shipping hvis satt, ellers billing
-    base = shipping if shipping.get("address1") or shipping.get("city") or shipping.get("zip") else billing
+    # Vanligvis er både navn og adresse på shipping; billing slås bare opp når noe mangler.
+    name = order.get("name") or _name(shipping)
+    # Bruk shipping hvis satt, ellers billing (CSV-jobber har nøklene med tomme verdier, så sjekk verdiene)
+    if shipping.get("address1") or shipping.get("city") or shipping.get("zip"):
+        base = shipping
+        if not name:
+            name = _name(order.get("billing_address") or {})
+    else:
+        base = order.get("billing_address") or {}
+        name = name or _name(base)
+    name = name or "Ukjent mottaker"
+    country = base.get("country_code")
     return {
         "name": name,
         "addressLine": base.get("address1") or "",
         "addressLine2": base.get("address2"),
         "postalCode": base.get("zip") or "",
         "city": base.get("city") or "",
-        "countryCode": (base.get("country_code") or "NO").upper(),
+        "countryCode": country.upper() if country else "NO",
         "reference": order.get("order_number") or order.get("id"),
         "contact": {
             "name": name,
@@ -136,78 +215,288 @@ def has_min_recipient(recipient: Dict[str, Any]) -> bool:
     return bool(recipient.get("addressLine") and recipient.get("city") and recipient.get("postalCode"))
 
 
+def _as_int(value: Any, default: int) -> int:
+    # CSV- og Shopify-jobber har allerede int; konverter bare strenger/None.
+    return value if type(value) is int else int(value or default)
+
+
 def build_package(order: Dict[str, Any]) -> Dict[str, Any]:
     line_items = order.get("line_items") or []
-    total_grams = 0
-    titles = []
-    for li in line_items:
-        qty = int(li.get("quantity") or 1)
-        grams = int(li.get("grams") or 0)
-        total_grams += max(0, grams) * max(1, qty)
-        if li.get("title"):
-            titles.append(str(li["title"]))
+    total_grams = sum(
+        max(0, _as_int(li.get("grams"), 0)) * max(1, _as_int(li.get("quantity"), 1)) for li in line_items
+    )
+    titles = [str(title) for li in line_items if (title := li.get("title"))]
     weight_kg = max(DEFAULT_PACKAGE["weightInKg"], total_grams / 1000.0 if total_grams else DEFAULT_PACKAGE["weightInKg"])
     description = "; ".join(titles) if titles else DEFAULT_PACKAGE["goodsDescription"]
-    pkg = dict(DEFAULT_PACKAGE)
-    pkg["weightInKg"] = round(weight_kg, 3)
-    pkg["goodsDescription"] = description
-    return pkg
-
-
-def download_label(url: str, headers: Dict[str, str], destination: Path) -> None:
-    destination.parent.mkdir(parents=True, exist_ok=True)
-    logging.info("⬇️ Laster ned label: %s", url)
-    resp = requests.get(url, headers=headers, timeout=30, stream=True)
-    if not resp.ok:
-        logging.error("Klarte ikke å laste ned label (HTTP %s): %s", resp.status_code, resp.text[:500])
-        return
-    with open(destination, "wb") as fh:
-        for chunk in resp.iter_content(chunk_size=8192):
-            if chunk:
-                fh.write(chunk)
-    logging.info("✅ Lagret label til %s", destination.resolve())
-    DOWNLOADED_LABELS.append(destination)
+    return {**DEFAULT_PACKAGE, "weightInKg": round(weight_kg, 3), "goodsDescription": description}
+
+
+def download_label(
+    url: str,
+    headers: Dict[str, str],
+    destination: Path,
+    session: Optional[requests.Session] = None,
+    buffer: Optional[BinaryIO] = None,
+) -> Optional[Path]:
+    """
+    Laster ned etiketten til destination, eller til buffer hvis gitt (destination er da bare navnet
+    den får hvis den senere må lagres). Returnerer destination ved suksess.
+    """
+    # LABEL_DIR er allerede opprettet og resolve()-et ved oppstart; ingen mkdir/resolve per etikett.
+    log.info("⬇️ Laster ned label: %s", url)
+    # Gjenbruk Bring-klientens session (keep-alive) når den finnes, så vi slipper ny TLS-handshake per label.
+    with (session or requests).get(url, headers=headers, timeout=LABEL_TIMEOUT, stream=True) as resp:
+        if not resp.ok:
+            log.error("Klarte ikke å laste ned label (HTTP %s): %s", resp.status_code, resp.text[:500])
+            return None
+        # Kopier rå-strømmen rett til fil i store blokker i stedet for en Python-løkke per 8 KiB.
+        resp.raw.decode_content = True
+        if buffer is not None:
+            shutil.copyfileobj(resp.raw, buffer, LABEL_COPY_BUFSIZE)
+            buffer.seek(0)
+            log.info("✅ Lastet ned label %s til minnet", destination.name)
+            return destination
+        with open(destination, "wb") as fh:
+            shutil.copyfileobj(resp.raw, fh, LABEL_COPY_BUFSIZE)
+    log.info("✅ Lagret label til %s", destination)
+    return destination
+
+
+_clients = threading.local()
+# Alle HTTP-sessioner trådene har åpnet, slik at keep-alive-tilkoblingene lukkes pent ved exit.
+_OPEN_SESSIONS: list[requests.Session] = []
+
+
+def _track_session(session: requests.Session) -> None:
+    with _RESULTS_LOCK:
+        _OPEN_SESSIONS.append(session)
+
+
+@atexit.register
+def _close_sessions() -> None:
+    with _RESULTS_LOCK:
+        sessions = _OPEN_SESSIONS[:]
+        _OPEN_SESSIONS.clear()
+    for session in sessions:
+        with contextlib.suppress(Exception):
+            session.close()
+
+
+def get_bring_client() -> BringClient:
+    """
+    Gjenbruk én BringClient (og dermed HTTP-sessionen) per tråd på tvers av jobber.
+    Nøkles på BRING_TEST_INDICATOR siden process_all_pending_jobs kan bytte modus.
+    """
+    test_indicator = os.getenv("BRING_TEST_INDICATOR", "false")
+    cache: Dict[str, BringClient] = getattr(_clients, "bring", None) or {}
+    _clients.bring = cache
+    client = cache.get(test_indicator)
+    if client is None:
+        client = cache[test_indicator] = BringClient()
+        _track_session(client.session)
+    return client
+
+
+def get_shopify_client() -> Optional[ShopifyClient]:
+    """
+    Lazy ShopifyClient per tråd. Mislykket init (f.eks. manglende token) huskes,
+    så vi ikke prøver på nytt for hver jobb.
+    """
+    client = getattr(_clients, "shopify", None)
+    if client is None:
+        try:
+            client = ShopifyClient()
+            _track_session(client.session)
+        except Exception:
+            log.debug("ShopifyClient init feilet (fortsetter uten Shopify-oppslag)", exc_info=True)
+            client = False
+        _clients.shopify = client
+    return client or None
+
+
+@functools.lru_cache(maxsize=32)
+def booking_skeleton(bring: BringClient) -> Dict[str, Any]:
+    """
+    De faste delene av booking-payloaden (produkt, tilleggstjenester, kundenummer, testIndicator),
+    bygget én gang per klient med build_booking_payload. Må ikke muteres.
+    """
+    return bring.build_booking_payload(
+        recipient={},
+        sender={},
+        packages=[],
+        product_id=CFG.product_id,
+        additional_services=[{"id": CFG.additional_service_id}],
+        shipping_datetime_iso="",
+    )
+
+
+def finalize_payload(
+    skeleton: Dict[str, Any],
+    *,
+    recipient: Dict[str, Any],
+    sender: Dict[str, Any],
+    return_to: Optional[Dict[str, Any]],
+    package: Dict[str, Any],
+    shipping_datetime_iso: str,
+    reference: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Fyller inn de jobbspesifikke feltene i en kopi av skjelettet (tilsvarer build_booking_payload)."""
+    consignment = skeleton["consignments"][0]
+    if reference:
+        recipient = {**recipient, "reference": reference}
+    return {
+        **skeleton,
+        "consignments": [{
+            **consignment,
+            "packages": [BringClient.normalize_package(package)],
+            "parties": {
+                "pickupPoint": None,
+                "recipient": recipient,
+                "returnTo": return_to,
+                "sender": sender,
+            },
+            "shippingDateTime": shipping_datetime_iso,
+        }],
+    }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Felles trådpool; trådene (og deres DB-/HTTP-tilkoblinger) gjenbrukes mellom batcher."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="packchicken-job")
+        return _executor
+
 
 # ------------------------------------------------------------
 # Kjernefunksjon
 # ------------------------------------------------------------
 
-def process_next_job(return_label: bool = False):
-    """Behandler neste pending jobb i databasen."""
-    job = db.get_next_job()
-    if not job:
-        logging.info("Ingen pending jobber.")
-        return False
+def next_shipping_time() -> str:
+    """Sendetidspunkt for Bring: 10 minutter frem i tid, UTC, uten mikrosekunder."""
+    return (datetime.now(timezone.utc) + timedelta(minutes=10)).replace(microsecond=0).isoformat()
+
 
-    job_id, job_data = job
-    logging.info("🟡 Starter behandling av jobb %s", job_data.get("id"))
+def process_jobs(
+    limit: int = JOB_BATCH_SIZE,
+    return_label: bool = False,
+    on_label: Optional[Callable[[Path, Optional[io.BytesIO]], None]] = None,
+    in_memory: bool = False,
+) -> int:
+    """
+    Reserverer og behandler opptil `limit` pending jobber, inntil WORKER_CONCURRENCY samtidig.
+    Sluttstatuser samles og skrives i én transaksjon, men senest hvert STATUS_FLUSH_SEC
+    sekund slik at GUI-et ser fremdrift også i store batcher.
+    on_label kalles for hver nedlastet etikett i jobb-rekkefølge (f.eks. fortløpende sammenslåing),
+    med PDFen som buffer når in_memory=True.
+    """
+    jobs = db.get_next_jobs(limit)
+    if not jobs:
+        log.info("Ingen pending jobber.")
+        return 0
+
+    pool = get_executor()
+    # Samme sendetidspunkt for hele batchen; en batch tar sekunder, godt innenfor 10-minuttersmarginen.
+    shipping_time = next_shipping_time()
+    futures = [
+        pool.submit(process_job, job_id, job_data, return_label, in_memory, shipping_time)
+        for job_id, job_data in jobs
+    ]
+    results: list[tuple[int, str]] = []
+    handed: set[int] = set()
+
+    def hand_off(job_id: int, label: Optional[Path], label_buf: Optional[io.BytesIO]) -> None:
+        # Etiketten gis videre før statusen registreres, slik at en booket etikett aldri
+        # blir liggende bare i en future (f.eks. ved Ctrl-C midt i en statusflush).
+        if job_id in handed:
+            return
+        handed.add(job_id)
+        if not label:
+            return
+        # Samles i jobb-rekkefølge slik at sammenslått PDF følger ordrelisten.
+        with _RESULTS_LOCK:
+            DOWNLOADED_LABELS.append(label)
+        if on_label:
+            on_label(label, label_buf)
+        elif label_buf is not None:
+            with open(label, "wb") as fh:
+                fh.write(label_buf.getvalue())
+
+    flushed = 0
+    last_flush = time.monotonic()
+    try:
+        for (job_id, _), fut in zip(jobs, futures):
+            status, label, label_buf = fut.result()
+            hand_off(job_id, label, label_buf)
+            results.append((job_id, status))
+            if time.monotonic() - last_flush >= STATUS_FLUSH_SEC:
+                db.update_status_bulk(results[flushed:])
+                flushed = len(results)
+                last_flush = time.monotonic()
+    finally:
+        # Jobber som ikke har startet (f.eks. ved Ctrl-C) legges tilbake i køen;
+        # påbegynte jobber fullføres slik at de ikke bookes to ganger, og etikettene deres tas vare på.
+        done_ids = {job_id for job_id, _ in results}
+        for (job_id, _), fut in zip(jobs, futures):
+            if job_id in done_ids:
+                continue
+            if fut.cancel():
+                results.append((job_id, "pending"))
+            else:
+                status, label, label_buf = fut.result()
+                hand_off(job_id, label, label_buf)
+                results.append((job_id, status))
+        db.update_status_bulk(results[flushed:])
+    return len(jobs)
+
+
+def process_job(
+    job_id: int,
+    job_data: Dict[str, Any],
+    return_label: bool = False,
+    in_memory: bool = False,
+    shipping_time: Optional[str] = None,
+) -> tuple[str, Optional[Path], Optional[io.BytesIO]]:
+    """
+    Booker én allerede reservert jobb hos Bring.
+    Returnerer sluttstatus ('done'/'failed'), eventuell etikett og, med in_memory=True,
+    etikett-PDFen som buffer i stedet for en fil i LABEL_DIR.
+    shipping_time settes av process_jobs for hele batchen; ellers beregnes den her.
+    Kjøres i trådpoolen, så delt tilstand må gå via _RESULTS_LOCK.
+    """
+    jid = job_data.get("id")
+    log.info("🟡 Starter behandling av jobb %s", jid)
 
     try:
         order = job_data.get("order") or job_data
-        bring = BringClient()
-        shopify_client: ShopifyClient | None = None
-        try:
-            shopify_client = ShopifyClient()
-        except Exception:
-            logging.debug("ShopifyClient init feilet (fortsetter uten Shopify-oppslag)", exc_info=True)
+        bring = get_bring_client()
 
         recipient = build_recipient(order)
-        # Hvis minimum adresse mangler, prøv å hente full ordre fra Shopify
-        if not has_min_recipient(recipient) and shopify_client:
+        # Hvis minimum adresse mangler, prøv å hente full ordre fra Shopify.
+        # ShopifyClient hentes bare da; de fleste jobber har komplett adresse.
+        shopify_client = None if has_min_recipient(recipient) else get_shopify_client()
+        if shopify_client:
             try:
                 oid = order.get("id") or order.get("order_id")
                 full = shopify_client.get_order(oid) if oid else None
                 if full and full.get("order"):
                     order = full["order"]
                     recipient = build_recipient(order)
-                    logging.info("Oppdaterte ordre fra Shopify for adressefelt. shipping_address=%s", order.get("shipping_address"))
+                    log.info("Oppdaterte ordre fra Shopify for adressefelt (jobb %s)", jid)
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("shipping_address=%s", order.get("shipping_address"))
             except Exception:
-                logging.exception("Kunne ikke hente ordre fra Shopify for adresseoppdatering")
+                log.exception("Kunne ikke hente ordre fra Shopify for adresseoppdatering")
 
         if not has_min_recipient(recipient):
-            logging.error("Manglende adresse etter alle forsøk. Recipient=%s", recipient)
+            log.error("Manglende adresse etter alle forsøk. Recipient=%s", recipient)
             raise RuntimeError("Manglende adressefelt (addressLine/city/postalCode) for mottaker")
-        shipping_time = (datetime.now(timezone.utc) + timedelta(minutes=10)).replace(microsecond=0).isoformat()
+        shipping_time = shipping_time or next_shipping_time()
         sender_env = sender_from_env()
         return_to_env = return_to_from_env()
 
@@ -225,28 +514,29 @@ def process_next_job(return_label: bool = False):
             recipient_payload["contact"] = {
                 "name": contact.get("name") or recipient_payload.get("name") or sender_env["contact"].get("name"),
                 "email": contact.get("email")
-                    or os.getenv("BRING_RETURN_EMAIL")
+                    or CFG.return_email
                     or sender_env["contact"].get("email")
                     or recipient.get("contact", {}).get("email"),
                 "phoneNumber": contact.get("phoneNumber")
-                    or os.getenv("BRING_RETURN_PHONE")
+                    or CFG.return_phone
                     or sender_env["contact"].get("phoneNumber")
                     or recipient.get("contact", {}).get("phoneNumber"),
             }
             if not (recipient_payload["contact"].get("email") or recipient_payload["contact"].get("phoneNumber")):
-                logging.error("Retur-etikett mangler epost/telefon for mottaker. Sett BRING_RETURN_EMAIL/PHONE eller BRING_SENDER_EMAIL/PHONE.")
-            logging.info("🔄 Genererer returetikett (sender=mottaker, recipient=RETURN_TO/SENDER)")
+                log.error("Retur-etikett mangler epost/telefon for mottaker. Sett BRING_RETURN_EMAIL/PHONE eller BRING_SENDER_EMAIL/PHONE.")
+            log.info("🔄 Genererer returetikett (sender=mottaker, recipient=RETURN_TO/SENDER)")
 
-        payload = bring.build_booking_payload(
+        payload = finalize_payload(
+            booking_skeleton(bring),
             recipient=recipient_payload,
             sender=sender_payload,
             return_to=return_to_payload,
-            packages=[build_package(order)],
-            product_id=os.getenv("BRING_PRODUCT_ID", "3584"),
-            additional_services=[{"id": os.getenv("BRING_ADDITIONAL_SERVICE_ID", "1081")}],
+            package=build_package(order),
             shipping_datetime_iso=shipping_time,
             reference=order.get("order_number"),
         )
+        label_path: Optional[Path] = None
+        label_buf: Optional[io.BytesIO] = None
         result = bring.book_shipment(payload)
         consignment = (result.get("consignments") or [{}])[0]
         confirmation = consignment.get("confirmation") or {}
@@ -257,7 +547,7 @@ def process_next_job(return_label: bool = False):
         labels_url = links.get("labels")
         if not tracking_number:
             raise RuntimeError(f"Bring booking mangler tracking: {result}")
-        tracking_url = links.get("tracking") if isinstance(links, dict) else None
+        tracking_url = links.get("tracking")
         if not tracking_url:
             tracking_url = f"https://sporing.bring.no/sporing/{tracking_number}"
 
@@ -267,26 +557,31 @@ def process_next_job(return_label: bool = False):
             order_name = order.get("name") or order.get("order_number") or order.get("order_id") or "order"
             order_slug = safe_slug(order_name if str(order_name).startswith("#") else f"#{order_name}")
             filename = f"{prefix}-{order_slug}{test_suffix}.pdf"
-            destination = LABEL_DIR / filename
-            download_label(labels_url, bring._headers(), destination)
+            label_buf = io.BytesIO() if in_memory else None
+            label_path = download_label(
+                labels_url, bring._headers(), LABEL_DIR / filename, session=bring.session, buffer=label_buf
+            )
+            if label_path is None:
+                label_buf = None
         else:
-            logging.info("Ingen labels_url i responsen; hopper over nedlasting.")
+            log.info("Ingen labels_url i responsen; hopper over nedlasting.")
 
         db.save_tracking(job_id, tracking_number=tracking_number, tracking_url=tracking_url)
-        db.update_status(job_id, "done")
-        logging.info("✅ Ferdig med jobb %s (tracking=%s)", job_data.get("id"), tracking_number)
+        log.info("✅ Ferdig med jobb %s (tracking=%s)", jid, tracking_number)
+        return "done", label_path, label_buf
 
     except BringError as e:
-        msg = f"Bring booking feilet for jobb {job_data.get('id')}: {e}"
-        logging.error("❌ %s | payload=%s", msg, getattr(e, "payload", None))
-        PROCESS_ERRORS.append(msg)
-        db.update_status(job_id, "failed")
+        msg = f"Bring booking feilet for jobb {jid}: {e}"
+        log.error("❌ %s | payload=%s", msg, getattr(e, "payload", None))
+        with _RESULTS_LOCK:
+            PROCESS_ERRORS.append(msg)
+        return "failed", None, None
     except Exception as exc:
-        msg = f"Feil under behandling av jobb {job_data.get('id')}: {exc}"
-        logging.exception("❌ %s", msg)
-        PROCESS_ERRORS.append(msg)
-        db.update_status(job_id, "failed")
-    return True
+        msg = f"Feil under behandling av jobb {jid}: {exc}"
+        log.exception("❌ %s", msg)
+        with _RESULTS_LOCK:
+            PROCESS_ERRORS.append(msg)
+        return "failed", None, None
 
 
 def process_all_pending_jobs(
@@ -302,33 +597,51 @@ def process_all_pending_jobs(
     db.init_db()
     DOWNLOADED_LABELS.clear()
     PROCESS_ERRORS.clear()
+    reload_settings()
     processed_jobs = 0
 
     original_test_indicator = os.environ.get("BRING_TEST_INDICATOR")
     if test_indicator is not None:
         os.environ["BRING_TEST_INDICATOR"] = "true" if test_indicator else "false"
 
-    while True:
-        processed = process_next_job(return_label=return_label)
-        if not processed:
-            break
-        processed_jobs += 1
-        if poll_interval > 0:
-            time.sleep(poll_interval)
+    # Etikettene slås sammen fortløpende mens resten av køen bookes. Ved sammenslåing holdes de
+    # enkelte etikettene i minnet; de skrives bare til LABEL_DIR hvis sammenslåingen feiler.
+    merger = ProgressiveMerger() if merge_labels else None
+    try:
+        while True:
+            processed = process_jobs(
+                return_label=return_label,
+                on_label=merger.add if merger else None,
+                in_memory=merger is not None,
+            )
+            if not processed:
+                break
+            processed_jobs += processed
+            if poll_interval > 0:
+                time.sleep(poll_interval)
+    except BaseException:
+        if merger:
+            with contextlib.suppress(Exception):
+                merger.close(None)
+            merger.spill()
+        raise
 
     merged_label: Optional[Path] = None
-    if merge_labels and DOWNLOADED_LABELS:
+    if merger:
         merged_label = LABEL_DIR / f"labels-merged-{datetime.now().strftime('%Y%m%d-%H%M%S')}.pdf"
         try:
-            combine_pdfs(DOWNLOADED_LABELS, merged_label)
-            logging.info("🗂️  Slått sammen %d label(s) til %s", len(DOWNLOADED_LABELS), merged_label)
+            merged_label = merger.close(merged_label)
+        except Exception:
+            merged_label = None
+            log.exception("Klarte ikke å slå sammen label-PDFer")
+            merger.spill()
+        if merged_label:
+            log.info("🗂️  Slått sammen %d label(s) til %s", len(DOWNLOADED_LABELS), merged_label)
             for p in DOWNLOADED_LABELS:
                 try:
                     p.unlink(missing_ok=True)
                 except Exception:
-                    logging.debug("Klarte ikke å slette %s", p, exc_info=True)
-        except Exception:
-            logging.exception("Klarte ikke å slå sammen label-PDFer")
+                    log.debug("Klarte ikke å slette %s", p, exc_info=True)
 
     # Revert envs to prior values so callers don't leak state
     if test_indicator is not None:
@@ -352,18 +665,18 @@ if __name__ == "__main__":
     db.init_db()
     poll_interval = int(os.getenv("WORKER_POLL_INTERVAL", "0"))
 
-    logging.info("🚀 Starter PackChicken Job Worker (poll_interval=%ss)", poll_interval)
+    log.info("🚀 Starter PackChicken Job Worker (poll_interval=%ss)", poll_interval)
     if poll_interval > 0:
         while True:
             try:
-                processed = process_next_job()
+                processed = process_jobs()
                 if not processed:
-                    time.sleep(poll_interval)
+                    db.wait_for_job(poll_interval)
             except KeyboardInterrupt:
-                logging.info("Avslutter etter Ctrl-C")
+                log.info("Avslutter etter Ctrl-C")
                 break
             except Exception:
-                logging.exception("Uventet feil i hoved-loop")
+                log.exception("Uventet feil i hoved-loop")
                 time.sleep(poll_interval)
     else:
         process_all_pending_jobs()